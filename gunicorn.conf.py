@@ -0,0 +1,18 @@
+import os
+
+# Gunicorn settings, picked up automatically by `gunicorn wsgi:app`
+bind = os.getenv('BIND', '0.0.0.0:5000')
+# Each worker has its own Genie event loop, so QUERY_WORKERS, QUERY_QUEUE_SIZE,
+# single-flight de-duplication and the exact-match cache all apply per worker;
+# keep the worker count small and scale with threads instead
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', '8'))
+timeout = 120
+
+# Keep worker heartbeat files in memory rather than on disk
+worker_tmp_dir = '/dev/shm'
+
+# Don't preload: each worker must import the app itself so it starts its own
+# Genie event loop thread, which would not survive a fork
+preload_app = False
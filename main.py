@@ -1,12 +1,24 @@
 import os
+import atexit
+import logging
 from flask import Flask, request, jsonify
-import requests
+import asyncio
+import concurrent.futures
+import aiohttp
 import time
-import json
-from slack_sdk import WebClient
+import orjson
+import ijson
+import random
+import hashlib
+from dataclasses import dataclass
+from typing import Optional
+from collections import OrderedDict
 from slack_sdk.signature import SignatureVerifier
 from dotenv import load_dotenv
-from threading import Thread
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+from threading import Thread, Lock
+from redisvl.extensions.cache.llm import SemanticCache
+from redisvl.utils.vectorize import HFTextVectorizer
 
 
 # Load environment variables
@@ -15,16 +27,139 @@ app = Flask(__name__)
 
 load_dotenv()  # Load variables from .env into environment
 
-DATABRICKS_HOST = os.getenv('DATABRICKS_HOST')
-DATABRICKS_TOKEN = os.getenv('DATABRICKS_TOKEN')
-GENIE_SPACE_ID = os.getenv('GENIE_SPACE_ID')
-SLACK_SIGNING_SECRET = os.getenv('SLACK_SIGNING_SECRET')
-SLACK_BOT_TOKEN = os.getenv('SLACK_BOT_TOKEN')
-COMMAND = os.getenv('COMMAND', '/bake')
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper())
+logger = logging.getLogger(__name__)
 
-# Initialize Slack client
-slack_client = WebClient(token=SLACK_BOT_TOKEN)
-signature_verifier = SignatureVerifier(SLACK_SIGNING_SECRET)
+REQUIRED_SETTINGS = ('DATABRICKS_HOST', 'DATABRICKS_TOKEN',
+                     'GENIE_SPACE_ID', 'SLACK_SIGNING_SECRET')
+
+# Optional settings and how to parse them; their defaults live on Config
+OPTIONAL_SETTINGS = {
+    'DATABRICKS_WAREHOUSE_ID': str,
+    'COMMAND': str,
+    'REDIS_URL': str,
+    'CACHE_TTL': int,
+    'EXACT_CACHE_SIZE': int,
+    'QUERY_WORKERS': int,
+    'QUERY_QUEUE_SIZE': int,
+    'GENIE_LONG_POLL': lambda value: value == '1',
+    'FLASK_DEBUG': lambda value: value == '1'
+}
+
+
+@dataclass(frozen=True)
+class Config:
+    """
+    Settings read from the environment once at startup
+    """
+    databricks_host: str
+    databricks_token: str
+    genie_space_id: str
+    slack_signing_secret: str
+    databricks_warehouse_id: Optional[str] = None
+    command: str = '/bake'
+    redis_url: Optional[str] = None
+    cache_ttl: int = 3600
+    exact_cache_size: int = 256
+    query_workers: int = 16
+    query_queue_size: int = 256
+    genie_long_poll: bool = False
+    flask_debug: bool = False
+
+
+def load_config():
+    """
+    Build the Config from the environment, failing fast when a required setting is missing
+    """
+    missing = [name for name in REQUIRED_SETTINGS if not os.getenv(name)]
+    if missing:
+        raise RuntimeError(
+            f"Missing required environment variables: {', '.join(missing)}")
+
+    return Config(
+        **{name.lower(): os.environ[name] for name in REQUIRED_SETTINGS},
+        **{name.lower(): parse(os.environ[name])
+           for name, parse in OPTIONAL_SETTINGS.items() if name in os.environ}
+    )
+
+
+CFG = load_config()
+
+# Databricks endpoints and auth, built once at import
+GENIE_BASE = f"https://{CFG.databricks_host}/api/2.0/genie/spaces/{CFG.genie_space_id}"
+SQL_STATEMENTS_URL = f"https://{CFG.databricks_host}/api/2.0/sql/statements"
+AUTH_HEADERS = {"Authorization": f"Bearer {CFG.databricks_token}"}
+
+# Genie message and SQL statement states
+TERMINAL_STATUSES = frozenset({'COMPLETED', 'FAILED', 'CANCELLED'})
+IN_PROGRESS_STATUSES = frozenset({'IN_PROGRESS', 'PENDING', 'FILTERING_CONTEXT',
+                                  'EXECUTING_QUERY', 'ASKING_AI', 'PENDING_WAREHOUSE'})
+STATEMENT_RUNNING_STATES = frozenset({'PENDING', 'RUNNING'})
+
+# Polling backoff: a fast first re-poll, then exponential growth with jitter
+POLL_FIRST_DELAY = 0.1
+POLL_BASE_DELAY = 0.25
+POLL_MAX_DELAY = 4.0
+
+# Server-side wait requested on the first poll when GENIE_LONG_POLL=1; the Genie
+# API doesn't document this parameter, so it is off by default
+LONG_POLL_WAIT = 50
+POLL_REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=60)
+
+# Databricks API retries for throttled and transient server errors
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# POSTs are not idempotent, so only retry responses proving the request was not processed
+POST_RETRY_STATUSES = frozenset({429, 503})
+RETRY_ATTEMPTS = 5
+RETRY_MAX_DELAY = 30
+
+# Only the first MAX_RESULT_ROWS rows are shown in Slack, so query results are
+# streamed and the download is abandoned once those rows have been read
+MAX_RESULT_ROWS = 10
+RESULT_CHUNK_SIZE = 64 * 1024
+
+# Initialize Slack request verification
+signature_verifier = SignatureVerifier(CFG.slack_signing_secret)
+
+# Shared event loop on a background thread; every Genie call runs on it as a
+# coroutine, so one thread services all in-flight Slack commands
+loop = asyncio.new_event_loop()
+Thread(target=loop.run_forever, name="genie-loop", daemon=True).start()
+
+# Shared Databricks and Slack sessions, created lazily on the event loop; they
+# are kept apart so the Databricks token is never sent to Slack
+session = None
+slack_session = None
+
+# Bounded work queue drained by QUERY_WORKERS worker tasks on the event loop;
+# handing a command to the loop may take at most ENQUEUE_TIMEOUT seconds
+work_queue = None
+ENQUEUE_TIMEOUT = 1
+
+# Genie calls in flight, keyed by exact-match cache key, so identical
+# concurrent prompts share one call; only touched from the event loop
+inflight = {}
+
+# SQL caches: an in-process exact-match layer in front of a Redis-backed
+# semantic layer, so near-duplicate prompts skip the Genie round-trip entirely
+exact_cache = OrderedDict()
+exact_cache_lock = Lock()
+
+# The semantic layer is optional and only used when cached SQL can be re-run on
+# a warehouse; if Redis or the embedding model is unavailable at startup, run
+# without it rather than keeping the bot from starting
+llmcache = None
+if CFG.redis_url and CFG.databricks_warehouse_id:
+    try:
+        llmcache = SemanticCache(
+            name="genie",
+            redis_url=CFG.redis_url,
+            distance_threshold=0.1,
+            vectorizer=HFTextVectorizer("redis/langcache-embed-v1"),
+            ttl=CFG.cache_ttl
+        )
+    except Exception as e:
+        logger.warning("Semantic cache unavailable, continuing without it: %s", e)
 
 
 @app.route('/slack/commands', methods=['POST'])
@@ -39,35 +174,93 @@ def slack_commands():
     # Extract command data
     command = request.form.get('command')
     text = request.form.get('text')
-    channel_id = request.form.get('channel_id')
+    response_url = request.form.get('response_url')
     user_id = request.form.get('user_id')
 
-    if command == COMMAND:
+    if command == CFG.command:
+        future = asyncio.run_coroutine_threadsafe(
+            enqueue_query(text, response_url), loop)
+        try:
+            queued = future.result(timeout=ENQUEUE_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            # The loop is stalled; don't hold the request past Slack's ack window.
+            # If the hand-off finished just as we timed out, cancelling does
+            # nothing and the query is already queued, so report its real outcome
+            if future.cancel():
+                queued = False
+            else:
+                queued = future.result()
+
+        if not queued:
+            return jsonify({"response_type": "ephemeral",
+                            "text": "Genie is busy right now, please try again in a moment."}), 200
+
         # Respond to Slack immediately to avoid timeout
         response_text = f"Processing your query: {text}..."
         # Optionally, make this response ephemeral (only visible to the user)
-        Thread(target=process_and_post_result, args=(text, channel_id)).start()
         return jsonify({"response_type": "ephemeral", "text": response_text}), 200
 
     return "Unsupported command", 400
 
 
-def process_and_post_result(text, channel_id):
+async def start_query_workers():
+    """
+    Create the work queue and start the workers that drain it
+    """
+    global work_queue
+    work_queue = asyncio.Queue(maxsize=CFG.query_queue_size)
+    for _ in range(CFG.query_workers):
+        loop.create_task(query_worker())
+
+
+async def enqueue_query(text, response_url):
+    """
+    Queue a query for the workers, returning False when the queue is full
+    """
+    try:
+        work_queue.put_nowait((text, response_url))
+        return True
+    except asyncio.QueueFull:
+        return False
+
+
+async def query_worker():
+    """
+    Process queued queries one at a time
+    """
+    while True:
+        text, response_url = await work_queue.get()
+        try:
+            await process_and_post_result(text, response_url)
+        except Exception as e:
+            logger.error("Error posting result to Slack: %s", e)
+        finally:
+            work_queue.task_done()
+
+
+async def process_and_post_result(text, response_url):
     """
     Run Genie query and post result to Slack asynchronously
     """
     try:
-        genie_response = call_genie_api(text)
-        slack_client.chat_postMessage(
-            channel=channel_id,
-            text=genie_response
-        )
+        genie_response = await call_genie_api(text)
+        await post_to_slack(response_url, genie_response)
     except Exception as e:
         error_message = f"Sorry, there was an error processing your request: {str(e)}"
-        slack_client.chat_postMessage(
-            channel=channel_id,
-            text=error_message
-        )
+        await post_to_slack(response_url, error_message)
+
+
+async def post_to_slack(response_url, text):
+    """
+    Post a message to the channel through the slash command's response_url
+    """
+    payload = {
+        "response_type": "in_channel",
+        "text": text
+    }
+
+    async with get_slack_session().post(response_url, json=payload) as response:
+        response.raise_for_status()
 
 
 def verify_slack_request(request):
@@ -85,17 +278,263 @@ def verify_slack_request(request):
             signature=signature
         )
     except Exception as e:
-        print(f"Error verifying Slack request: {e}")
+        logger.error("Error verifying Slack request: %s", e)
         return False
 
 
-def call_genie_api(message):
+def get_session():
+    """
+    Return the shared Databricks session, creating it on first use
+
+    Must be called from the event loop, which owns the session
+    """
+    global session
+    if session is None:
+        session = aiohttp.ClientSession(
+            headers=AUTH_HEADERS,
+            connector=aiohttp.TCPConnector(limit=20),
+            json_serialize=lambda obj: orjson.dumps(obj).decode()
+        )
+    return session
+
+
+def get_slack_session():
+    """
+    Return the shared Slack session, creating it on first use
+
+    Must be called from the event loop, which owns the session
+    """
+    global slack_session
+    if slack_session is None:
+        slack_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=10))
+    return slack_session
+
+
+async def close_sessions():
+    """
+    Close the shared Databricks and Slack sessions
+    """
+    for open_session in (session, slack_session):
+        if open_session is not None:
+            await open_session.close()
+
+
+def is_retryable(exception):
+    """
+    Check whether a failed Databricks GET is worth retrying
+    """
+    if isinstance(exception, aiohttp.ClientResponseError):
+        return exception.status in RETRY_STATUSES
+    return isinstance(exception, aiohttp.ClientConnectionError)
+
+
+def is_retryable_post(exception):
+    """
+    Check whether a failed Databricks POST was rejected unprocessed and can be safely retried
+    """
+    return (isinstance(exception, aiohttp.ClientResponseError)
+            and exception.status in POST_RETRY_STATUSES)
+
+
+def wait_retry_after(retry_state):
+    """
+    Wait for the server's Retry-After when it sent one, otherwise back off exponentially with jitter
+    """
+    headers = getattr(retry_state.outcome.exception(), 'headers', None) or {}
+    retry_after = headers.get('Retry-After', '')
+    if retry_after.isdigit():
+        return min(float(retry_after), RETRY_MAX_DELAY)
+    return wait_backoff(retry_state)
+
+
+wait_backoff = wait_exponential_jitter(initial=0.5, max=RETRY_MAX_DELAY)
+
+
+retry_databricks = retry(retry=retry_if_exception(is_retryable), wait=wait_retry_after,
+                         stop=stop_after_attempt(RETRY_ATTEMPTS), reraise=True)
+retry_databricks_post = retry(retry=retry_if_exception(is_retryable_post), wait=wait_retry_after,
+                              stop=stop_after_attempt(RETRY_ATTEMPTS), reraise=True)
+
+
+@retry_databricks_post
+async def post_json(url, **kwargs):
+    """
+    Send a Databricks API POST and return the JSON body, retrying only when the
+    request was throttled or turned away before being processed
+    """
+    async with get_session().post(url, **kwargs) as response:
+        response.raise_for_status()
+        return orjson.loads(await response.read())
+
+
+@retry_databricks
+async def stream_query_result(url, **kwargs):
+    """
+    Stream a Genie query result, keeping only the manifest and the first
+    MAX_RESULT_ROWS rows instead of downloading and parsing the whole payload
+
+    The result records how many rows were read and whether the download was
+    cut short, so the row count survives a manifest without total_row_count
+    """
+    manifests = ijson.sendable_list()
+    rows = ijson.sendable_list()
+    dropped_rows = 0
+    truncated = False
+    manifest_parser = ijson.items_coro(
+        manifests, 'statement_response.manifest', use_float=True)
+    rows_parser = ijson.items_coro(
+        rows, 'statement_response.result.data_array.item', use_float=True)
+
+    async with get_session().get(url, **kwargs) as response:
+        response.raise_for_status()
+
+        async for chunk in response.content.iter_chunked(RESULT_CHUNK_SIZE):
+            manifest_parser.send(chunk)
+            rows_parser.send(chunk)
+            dropped_rows += max(0, len(rows) - MAX_RESULT_ROWS)
+            del rows[MAX_RESULT_ROWS:]
+
+            if manifests and dropped_rows:
+                # Everything shown in Slack has arrived; drop the rest of the download
+                truncated = not response.content.at_eof()
+                response.close()
+                break
+        else:
+            manifest_parser.close()
+            rows_parser.close()
+            dropped_rows += max(0, len(rows) - MAX_RESULT_ROWS)
+            del rows[MAX_RESULT_ROWS:]
+
+    return {
+        "statement_response": {
+            "manifest": manifests[0] if manifests else {},
+            "result": {
+                "data_array": list(rows),
+                "row_count": len(rows) + dropped_rows,
+                "truncated": truncated
+            }
+        }
+    }
+
+
+def cache_key(message):
+    """
+    Build the exact-match cache key for a message
+    """
+    normalized = " ".join(message.lower().split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+async def get_cached_sql(message):
+    """
+    Look up the cached SQL translation for a message, checking the exact-match
+    layer before paying for an embedding in the semantic layer
+    """
+    key = cache_key(message)
+    with exact_cache_lock:
+        entry = exact_cache.get(key)
+        if entry:
+            stored_at, sql_query = entry
+            if time.time() - stored_at < CFG.cache_ttl:
+                exact_cache.move_to_end(key)
+                return sql_query
+            del exact_cache[key]
+
+    if llmcache:
+        try:
+            # Embedding is CPU-bound and sync, so keep it off the event loop
+            hit = await asyncio.to_thread(llmcache.check, prompt=message)
+            if hit:
+                sql_query = orjson.loads(hit[0]["response"]).get('sql')
+                if sql_query:
+                    store_exact_sql(key, sql_query)
+                    return sql_query
+        except Exception as e:
+            logger.error("Error checking semantic cache: %s", e)
+
+    return None
+
+
+def store_exact_sql(key, sql_query):
+    """
+    Store a SQL translation in the exact-match layer, evicting the least recently used entry
+    """
+    with exact_cache_lock:
+        exact_cache[key] = (time.time(), sql_query)
+        exact_cache.move_to_end(key)
+        if len(exact_cache) > CFG.exact_cache_size:
+            exact_cache.popitem(last=False)
+
+
+async def cache_sql(message, sql_query):
+    """
+    Store the SQL Genie generated for a message in both cache layers
+    """
+    store_exact_sql(cache_key(message), sql_query)
+
+    if llmcache:
+        try:
+            await asyncio.to_thread(llmcache.store, prompt=message,
+                                    response=orjson.dumps({"sql": sql_query}).decode())
+        except Exception as e:
+            logger.error("Error storing semantic cache entry: %s", e)
+
+
+async def evict_cached_sql(message):
+    """
+    Remove the cached SQL translation for a message from both cache layers
+    """
+    with exact_cache_lock:
+        exact_cache.pop(cache_key(message), None)
+
+    if llmcache:
+        try:
+            hit = await asyncio.to_thread(llmcache.check, prompt=message)
+            if hit:
+                await asyncio.to_thread(llmcache.drop, keys=[entry["key"] for entry in hit])
+        except Exception as e:
+            logger.error("Error evicting semantic cache entry: %s", e)
+
+
+async def call_genie_api(message):
     """
     Call the Databricks Genie API with the given message
+
+    An identical prompt already in flight is awaited instead of starting
+    a second Genie conversation
+    """
+    key = cache_key(message)
+    task = inflight.get(key)
+    if task is None:
+        task = loop.create_task(run_genie_query(message))
+        inflight[key] = task
+        task.add_done_callback(lambda _: inflight.pop(key, None))
+
+    # Shield the shared task so one cancelled caller doesn't cancel it for the rest
+    return await asyncio.shield(task)
+
+
+async def run_genie_query(message):
+    """
+    Run a single Genie query for the given message
+
+    Cache hits skip Genie and re-execute the cached SQL on the warehouse,
+    so the answer reflects current data
     """
     try:
+        if CFG.databricks_warehouse_id:
+            sql_query = await get_cached_sql(message)
+            if sql_query:
+                try:
+                    return await execute_sql_direct(sql_query)
+                except Exception as e:
+                    # The cached SQL no longer works; forget it and ask Genie again
+                    logger.warning("Cached SQL failed, falling back to Genie: %s", e)
+                    await evict_cached_sql(message)
+
         # Step 1: Start a conversation
-        conversation_response = start_genie_conversation(message)
+        conversation_response = await start_genie_conversation(message)
 
         if not conversation_response:
             return "Error: Could not start conversation with Genie"
@@ -108,22 +547,50 @@ def call_genie_api(message):
             return "Error: Invalid response from Genie API"
 
         # Step 2: Poll for the response
-        message_data = poll_genie_message(conversation_id, message_id)
+        message_data = await poll_genie_message(conversation_id, message_id)
 
         # Step 3: Process the response
         status = message_data.get('status')
 
         if status == 'COMPLETED':
-            # Check if there are attachments (query results)
+            # Only query attachments have a query result; text and suggested
+            # question attachments don't
             attachments = message_data.get('attachments', [])
-            if attachments:
-                # Get the query result using executeMessageAttachmentQuery
-                attachment_id = attachments[0].get('attachment_id')
-                print(f"Attachment ID: {attachment_id}")
-                return execute_message_attachment_query(conversation_id, message_id, attachment_id)
+            query_attachments = [a for a in attachments if a.get('query')]
+            if query_attachments:
+                attachment_ids = [attachment.get('attachment_id')
+                                  for attachment in query_attachments]
+                logger.debug("Attachment IDs: %s", attachment_ids)
+
+                # Get every query attachment's result concurrently
+                results = await asyncio.gather(*[
+                    execute_message_attachment_query(
+                        conversation_id, message_id, attachment_id)
+                    for attachment_id in attachment_ids
+                ], return_exceptions=True)
+
+                # Cache the generated SQL once its result came back, so similar
+                # prompts can skip Genie; a hit replays a single statement, so
+                # multi-query answers aren't cached
+                sql_query = query_attachments[0]['query'].get('query')
+                if (len(query_attachments) == 1 and sql_query and CFG.databricks_warehouse_id
+                        and not isinstance(results[0], Exception)):
+                    await cache_sql(message, sql_query)
+
+                replies = []
+                for result in results:
+                    if isinstance(result, Exception):
+                        logger.error("Error executing message attachment query: %s", result)
+                        replies.append(f"Error retrieving query result: {str(result)}")
+                    else:
+                        replies.append(result)
+                return "\n\n".join(replies)
             else:
                 # Return the text response
-                return message_data.get('content', 'No response content available')
+                text_attachment = next(
+                    (a['text'] for a in attachments if a.get('text')), {})
+                return (text_attachment.get('content')
+                        or message_data.get('content', 'No response content available'))
 
         elif status == 'FAILED':
             error = message_data.get('error', {})
@@ -133,152 +600,236 @@ def call_genie_api(message):
             return f"Unexpected status: {status}"
 
     except Exception as e:
-        print(f"Error calling Genie API: {e}")
+        logger.error("Error calling Genie API: %s", e)
         return f"Error: {str(e)}"
 
 
-def start_genie_conversation(message):
+async def start_genie_conversation(message):
     """
     Start a new conversation with Genie
     """
-    url = f"https://{DATABRICKS_HOST}/api/2.0/genie/spaces/{GENIE_SPACE_ID}/start-conversation"
-    headers = {
-        "Authorization": f"Bearer {DATABRICKS_TOKEN}",
-        "Content-Type": "application/json"
-    }
+    url = f"{GENIE_BASE}/start-conversation"
     payload = {
         "content": message
     }
 
     try:
-        response = requests.post(url, headers=headers,
-                                 json=payload, timeout=3000)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error starting Genie conversation: {e}")
+        return await post_json(url, json=payload,
+                               timeout=aiohttp.ClientTimeout(total=3000))
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error("Error starting Genie conversation: %s", e)
         return None
 
 
-def poll_genie_message(conversation_id, message_id, max_attempts=30, delay=2):
+def backoff_delay(attempt):
     """
-    Poll for the message status from Genie
+    Compute the delay before the next poll using capped exponential backoff with jitter
     """
-    url = f"https://{DATABRICKS_HOST}/api/2.0/genie/spaces/{GENIE_SPACE_ID}/conversations/{conversation_id}/messages/{message_id}"
-    headers = {
-        "Authorization": f"Bearer {DATABRICKS_TOKEN}"
-    }
+    if attempt == 0:
+        return POLL_FIRST_DELAY
+    return min(POLL_MAX_DELAY, POLL_BASE_DELAY * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+
+async def poll_genie_message(conversation_id, message_id, timeout=120):
+    """
+    Poll for the message status from Genie until it settles or the timeout elapses
 
-    for attempt in range(max_attempts):
+    With GENIE_LONG_POLL enabled the first request long-polls; if it comes back
+    still in progress the loop falls back to short polls with backoff
+    """
+    url = f"{GENIE_BASE}/conversations/{conversation_id}/messages/{message_id}"
+
+    deadline = time.monotonic() + timeout
+    attempt = 0
+
+    while time.monotonic() < deadline:
         try:
-            response = requests.get(url, headers=headers, timeout=3000)
-            response.raise_for_status()
-            message_data = response.json()
+            if attempt == 0 and CFG.genie_long_poll:
+                # Long-poll first so the server can hold the request until the message settles
+                params = {"wait": f"{LONG_POLL_WAIT}s"}
+                request_timeout = aiohttp.ClientTimeout(total=LONG_POLL_WAIT + 5)
+            else:
+                params = None
+                request_timeout = POLL_REQUEST_TIMEOUT
+            async with get_session().get(url, params=params, timeout=request_timeout) as response:
+                response.raise_for_status()
+                message_data = orjson.loads(await response.read())
 
             status = message_data.get('status')
 
             # Handle completed or failed states
-            if status in ['COMPLETED', 'FAILED', 'CANCELLED']:
+            if status in TERMINAL_STATUSES:
                 return message_data
 
             # Handle in-progress states (including the new FILTERING_CONTEXT status)
-            elif status in ['IN_PROGRESS', 'PENDING', 'FILTERING_CONTEXT', 'EXECUTING_QUERY', 'ASKING_AI', 'PENDING_WAREHOUSE']:
-                # Continue polling
-                time.sleep(delay)
-                continue
-
-            else:
-                print(f"Unknown status: {status}")
+            elif status not in IN_PROGRESS_STATUSES:
+                logger.warning("Unknown status: %s", status)
                 return message_data
 
-        except requests.exceptions.RequestException as e:
-            print(f"Error polling Genie message (attempt {attempt + 1}): {e}")
-            if attempt == max_attempts - 1:
-                raise Exception(
-                    f"Failed to get response after {max_attempts} attempts")
-            time.sleep(delay)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning("Error polling Genie message (attempt %d): %s", attempt + 1, e)
+
+        # Continue polling
+        await asyncio.sleep(min(backoff_delay(attempt),
+                                max(0, deadline - time.monotonic())))
+        attempt += 1
 
     raise Exception("Timeout waiting for Genie response")
 
 
-def execute_message_attachment_query(conversation_id, message_id, attachment_id):
+async def execute_message_attachment_query(conversation_id, message_id, attachment_id):
     """
     Execute the query for a message attachment using the correct query-result endpoint
+
+    Request failures are raised so the caller knows not to cache the SQL
     """
     # Corrected URL - using query-result instead of execute-attachment-query
-    url = f"https://{DATABRICKS_HOST}/api/2.0/genie/spaces/{GENIE_SPACE_ID}/conversations/{conversation_id}/messages/{message_id}/attachments/{attachment_id}/query-result"
-    headers = {
-        "Authorization": f"Bearer {DATABRICKS_TOKEN}",
-        "Content-Type": "application/json"
+    url = f"{GENIE_BASE}/conversations/{conversation_id}/messages/{message_id}/attachments/{attachment_id}/query-result"
+
+    # Use GET request instead of POST for query-result endpoint
+    result_data = await stream_query_result(url,
+                                            timeout=aiohttp.ClientTimeout(total=6000))
+
+    # Format the result for Slack
+    return format_query_result(result_data)
+
+
+async def execute_sql_direct(sql_query):
+    """
+    Execute SQL directly on the warehouse using the SQL Statement Execution API
+
+    Failures are raised so a stale cache entry can fall back to Genie
+    """
+    url = SQL_STATEMENTS_URL
+    payload = {
+        "statement": sql_query,
+        "warehouse_id": CFG.databricks_warehouse_id,
+        "wait_timeout": "30s",
+        "on_wait_timeout": "CONTINUE"
     }
 
-    try:
-        # Use GET request instead of POST for query-result endpoint
-        response = requests.get(url, headers=headers,
-                                timeout=6000)  # Debugging output
-        response.raise_for_status()
-        result_data = response.json()
+    statement_data = await post_json(url, json=payload,
+                                     timeout=aiohttp.ClientTimeout(total=3000))
+
+    state = statement_data.get('status', {}).get('state')
+    if state in STATEMENT_RUNNING_STATES:
+        statement_data = await poll_sql_statement(
+            statement_data.get('statement_id'))
+        state = statement_data.get('status', {}).get('state')
 
-        # Format the result for Slack
-        return format_query_result(result_data)
+    if state != 'SUCCEEDED':
+        error = statement_data.get('status', {}).get('error', {})
+        raise Exception(f"Query failed: {error.get('message', state)}")
 
-    except requests.exceptions.RequestException as e:
-        print(f"Error executing message attachment query: {e}")
-        return f"Error retrieving query result: {str(e)}"
+    # Statement responses share the shape of Genie's statement_response
+    return format_query_result({"statement_response": statement_data}, sql_query)
 
 
-def format_query_result(result_data):
+async def poll_sql_statement(statement_id, timeout=120):
+    """
+    Poll for the statement status from the SQL Statement Execution API
+    """
+    url = f"{SQL_STATEMENTS_URL}/{statement_id}"
+
+    deadline = time.monotonic() + timeout
+    attempt = 0
+
+    while time.monotonic() < deadline:
+        try:
+            async with get_session().get(url, timeout=POLL_REQUEST_TIMEOUT) as response:
+                response.raise_for_status()
+                statement_data = orjson.loads(await response.read())
+
+            if statement_data.get('status', {}).get('state') not in STATEMENT_RUNNING_STATES:
+                return statement_data
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning("Error polling SQL statement (attempt %d): %s", attempt + 1, e)
+
+        await asyncio.sleep(min(backoff_delay(attempt),
+                                max(0, deadline - time.monotonic())))
+        attempt += 1
+
+    raise Exception("Timeout waiting for SQL statement result")
+
+
+def format_query_result(result_data, sql_query=None):
     """
     Format the Genie query result for display in Slack
     """
-    print("Formatting query result...")  # Debugging output
-    print(f"Result data: {json.dumps(result_data, indent=2)}")
+    logger.debug("Formatting query result...")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Result data: %s", orjson.dumps(
+            result_data, option=orjson.OPT_INDENT_2).decode())
 
     try:
-        sql_query = result_data.get('statement_response', {}).get(
+        sql_query = sql_query or result_data.get('statement_response', {}).get(
             'manifest', {}).get('schema', {}).get('sql')
 
         result = result_data.get('statement_response', {}).get('result', {})
         data_array = result.get('data_array', [])
 
-        columns = result_data.get('statement_response', {}).get(
-            'manifest', {}).get('schema', {}).get('columns', [])
+        manifest = result_data.get('statement_response', {}).get('manifest', {})
+        columns = manifest.get('schema', {}).get('columns', [])
         column_names = [col.get('name', '') for col in columns]
 
+        # Streamed results only carry the rows shown, so prefer the manifest's
+        # count, then the number of rows the stream read
+        total_rows = manifest.get(
+            'total_row_count', result.get('row_count', len(data_array)))
+
         if not data_array:
             return "No data returned from the query"
 
-        formatted_result = ""
+        # Collect the pieces and join once instead of growing a string
+        parts = []
 
         if sql_query:
-            formatted_result += "*SQL Query: *\n```"
-            formatted_result += f"{sql_query}\n"
-            formatted_result += "```\n\n"
+            parts.append(f"*SQL Query: *\n```{sql_query}\n```\n\n")
 
         if column_names:
             header_row = " | ".join(column_names)
             separator_row = " | ".join(['---'] * len(column_names))
-            formatted_result += "*Results:*\n"
-            formatted_result += "```"
-            formatted_result += f"{header_row}\n"
-            formatted_result += f"{separator_row}\n"
+            parts.append(f"*Results:*\n```{header_row}\n{separator_row}\n")
         else:
-            formatted_result += "*Results:*\n```\n"
-
-        for row in data_array[:10]:
-            row_str = " | ".join(str(item) for item in row)
-            formatted_result += f"{row_str}\n"
-
-        if len(data_array) > 10:
-            formatted_result += f"... and {len(data_array) - 10} more rows\n"
+            parts.append("*Results:*\n```\n")
+
+        # Result rows share one width, so build the row format once and reuse it
+        row_format = " | ".join(["%s"] * len(data_array[0])) + "\n"
+        parts.append("".join(row_format % tuple(row)
+                             for row in data_array[:MAX_RESULT_ROWS]))
+
+        if total_rows > MAX_RESULT_ROWS:
+            more_rows = total_rows - MAX_RESULT_ROWS
+            if 'total_row_count' not in manifest and result.get('truncated'):
+                # The stream stopped early, so the count is only a lower bound
+                parts.append(f"... and at least {more_rows} more rows\n")
+            else:
+                parts.append(f"... and {more_rows} more rows\n")
 
-        formatted_result += "```"
-        return formatted_result
+        parts.append("```")
+        return "".join(parts)
 
     except Exception as e:
-        print(f"Error formatting query result: {e}")
+        logger.error("Error formatting query result: %s", e)
         return f"Query completed but failed to format result: {str(e)}"
 
 
+def shutdown():
+    """
+    Close the shared sessions on the event loop before the process exits
+    """
+    future = asyncio.run_coroutine_threadsafe(close_sessions(), loop)
+    try:
+        future.result(timeout=5)
+    except concurrent.futures.TimeoutError:
+        logger.warning("Timed out closing HTTP sessions on shutdown")
+
+
+# Start the query workers on the event loop, and close its sessions on shutdown
+asyncio.run_coroutine_threadsafe(start_query_workers(), loop).result()
+atexit.register(shutdown)
+
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    app.run(debug=CFG.flask_debug, host='0.0.0.0', port=5000)
@@ -0,0 +1,5 @@
+from main import app
+
+# Entry point for production WSGI servers, e.g. `gunicorn wsgi:app`
+if __name__ == '__main__':
+    app.run()